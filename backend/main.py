@@ -1,17 +1,29 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-import json
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
 import os
+import errno
+import time
+import struct
+import functools
+import hashlib
+from collections import OrderedDict
+import mmap
 from datetime import datetime
 import asyncio
 import threading
+from contextlib import contextmanager
 import tempfile
+import logging
 import shutil
-import requests
+import orjson
+import msgpack
 import pylitex
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Shareboard API", description="API for shared document management")
 
 # Enable CORS for frontend
@@ -23,6 +35,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+LITEX_CODE_MAX_LENGTH = 65536  # 单次运行的 Litex 代码最大长度
+LITEX_CACHE_SIZE = 512  # 缓存的运行结果条数
+
 # Document model - 更新为只包含元数据，内容从文件读取
 class Document(BaseModel):
     id: str
@@ -32,7 +47,10 @@ class Document(BaseModel):
     updated_at: datetime
 
 class DocumentMeta(BaseModel):
-    """文档元数据，存储在documents.json中"""
+    """文档元数据的结构说明，存储在 documents.msgpack（快照）与 documents.journal（追加日志）中
+
+    模块内部以同样字段的字典保存元数据，不实例化该模型，仅作为结构参考。
+    """
     id: str
     title: str
     file_path: str  # 文件路径
@@ -48,24 +66,160 @@ class DocumentUpdate(BaseModel):
     content: Optional[str] = None
 
 class LitexCodeRequest(BaseModel):
-    code: str
+    code: str = Field(max_length=LITEX_CODE_MAX_LENGTH)
 
 class LitexCodeResponse(BaseModel):
     result: str
 
 # 文件存储配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DOCUMENTS_FILE = os.path.join(BASE_DIR, "documents.json")
+DOCUMENTS_FILE = os.path.join(BASE_DIR, "documents.msgpack")  # 元数据快照
+DOCUMENTS_LOG = os.path.join(BASE_DIR, "documents.journal")  # 元数据追加日志，每条变更一个msgpack对象
+NEXT_ID_FILE = os.path.join(BASE_DIR, "next_id.bin")  # 下一个文档ID，8字节大端整数
+LEGACY_DOCUMENTS_FILE = os.path.join(BASE_DIR, "documents.json")  # 旧版JSON快照，启动时迁移
 FILES_DIR = os.path.join(BASE_DIR, "file")
 BACKUP_DIR = os.path.join(BASE_DIR, "backup")
+# 文档文件权限：与普通 open(path, 'w') 一致，即 0666 去掉当前 umask（通常为0644）
+# os.umask 只能“设置并返回旧值”，在模块加载时（尚无其他线程）读取一次
+_umask = os.umask(0)
+os.umask(_umask)
+CONTENT_FILE_MODE = 0o666 & ~_umask
+BACKUP_MIN_INTERVAL_NS = 5 * 10**9  # 更新时同一文档两次备份的最小间隔
+MMAP_MIN_BYTES = 64 * 1024  # 快照小于该大小时直接读取，mmap的建立开销不划算
+UNPACK_READ_SIZE = 64 * 1024  # 重放日志时每次读取的字节数
+WRITE_MAX_ATTEMPTS = 5  # 单个文档的变更最多尝试落盘的次数，之后放弃并报错
+WRITE_RETRY_MIN_DELAY = 0.5  # 落盘失败后首次重试的等待秒数，之后指数退避
+WRITE_RETRY_MAX_DELAY = 30.0  # 重试等待的上限
+COMPACT_MIN_BYTES = 64 * 1024  # 日志小于该大小时不压缩，避免快照很小时频繁重写
+
+CONTENT_LOCK_SHARDS = 16  # 文档内容锁的分片数
+
+class RWLock:
+    """读写锁：多个读者可并发，写者独占；写者优先，避免写者饥饿
+
+    持有写锁的线程可以重入写锁，也可以直接获取读锁。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._cond:
+            owned = self._writer == me
+            if not owned:
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            if not owned:
+                with self._cond:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if self._writer_depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
+# 元数据（快照+日志）使用一把读写锁；文档内容按ID哈希分片加锁
+_meta_lock = RWLock()
+_content_locks = [RWLock() for _ in range(CONTENT_LOCK_SHARDS)]
+
+# 文档ID计数器，首次使用时从 next_id.bin 和现有文档ID初始化
+_id_lock = threading.Lock()
+_next_id: Optional[int] = None
+
+# 每个文档上次备份的时间（time.monotonic_ns）
+_last_backup_ns: Dict[str, int] = {}
+
+# 后台写入队列与任务，在应用启动时创建
+_write_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+
+# 已提交但尚未落盘的变更：文档ID -> 文档（None表示已删除），读路径优先查这里
+_pending_writes: Dict[str, Optional[Document]] = {}
+
+# Litex 运行结果缓存：blake2b(代码) -> 运行任务，按LRU淘汰
+_litex_cache: "OrderedDict[bytes, asyncio.Task]" = OrderedDict()
+
+# 本进程是否已检查并修复过日志末尾的残缺记录
+_meta_log_repaired = False
 
-_file_lock = threading.RLock()
+# 元数据缓存：(快照与日志的 (st_mtime_ns, st_size), 元数据元组)，由 _meta_lock 保护
+# 以及文档ID到元组下标的索引，只在缓存重建时构建一次
+_meta_cache: Optional[Tuple[tuple, Tuple[Dict[str, Any], ...], Dict[str, int]]] = None
 
 def _ensure_dirs_exist():
     """确保所需目录存在"""
     os.makedirs(FILES_DIR, exist_ok=True)
     os.makedirs(BACKUP_DIR, exist_ok=True)
 
+def _fsync_dir(dir_path: str):
+    """fsync目录，使其中的 rename 在崩溃后依然有效"""
+    if os.name != 'posix':
+        return
+    dir_fd = os.open(dir_path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def _atomic_write_sync(path: str, data: bytes, prefix: str, suffix: str, mode: Optional[int] = None):
+    """原子写入：写临时文件并fsync，os.replace 到目标路径后再fsync所在目录
+
+    mkstemp 创建的临时文件权限为0600，需要其他权限时通过 mode 指定。
+    """
+    dir_path = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=prefix, suffix=suffix)
+    renamed = False
+    try:
+        if mode is not None and hasattr(os, "fchmod"):
+            os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        renamed = True
+    finally:
+        # 成功时临时文件已被重命名，无需再检查和删除
+        if not renamed:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+    _fsync_dir(dir_path)
+
+def _content_lock(doc_id: str) -> RWLock:
+    """获取文档内容所在分片的读写锁"""
+    return _content_locks[hash(doc_id) % CONTENT_LOCK_SHARDS]
+
 def _get_file_path(doc_id: str) -> str:
     """获取文档文件路径"""
     return os.path.join(FILES_DIR, f"{doc_id}.lix")
@@ -75,33 +229,240 @@ def _get_backup_path(doc_id: str) -> str:
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
     return os.path.join(BACKUP_DIR, f"{doc_id}.{timestamp}.lix")
 
-def _load_document_metas_sync() -> List[DocumentMeta]:
-    """从JSON文件加载文档元数据"""
+@functools.lru_cache(maxsize=4096)
+def _parse_ts(value: str) -> datetime:
+    """解析ISO时间戳；created_at 与 updated_at 经常相同，批量创建的文档也常共享时间戳，因此缓存结果"""
+    return datetime.fromisoformat(value)
+
+def _meta_from_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    """从磁盘记录还原元数据
+
+    元数据在模块内部一直以字典形式保存（字段同 DocumentMeta），记录由本模块自己写入，
+    类型可信，因此不经过pydantic，只解析时间戳。
+    """
+    data["created_at"] = _parse_ts(data["created_at"])
+    data["updated_at"] = _parse_ts(data["updated_at"])
+    return data
+
+def _encode_meta_value(obj):
+    """msgpack 序列化时将 datetime 转为ISO字符串"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def _apply_meta_record(metas: Dict[str, Dict[str, Any]], record: dict):
+    """将一条日志记录应用到元数据字典上"""
+    meta = record["meta"]
+    if record["op"] == "put":
+        metas[meta["id"]] = _meta_from_record(meta)
+    elif record["op"] == "del":
+        metas.pop(meta["id"], None)
+
+def _read_meta_snapshot_sync() -> Dict[str, Dict[str, Any]]:
+    """读取元数据快照 documents.msgpack"""
     if not os.path.exists(DOCUMENTS_FILE):
-        return []
+        return {}
+    try:
+        with open(DOCUMENTS_FILE, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < MMAP_MIN_BYTES:
+                data = msgpack.unpackb(f.read(), raw=False)
+            else:
+                # 大文件直接解析映射的内存，省去一次整文件复制；须在mmap关闭前解析完
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = msgpack.unpackb(mm, raw=False)
+        return {meta["id"]: _meta_from_record(meta) for meta in data}
+    except (ValueError, FileNotFoundError):
+        return {}
+
+def _replay_meta_log_sync(metas: Dict[str, Dict[str, Any]]) -> int:
+    """按顺序重放日志 documents.journal 中的变更，返回最后一条完整记录的结束位置
+
+    崩溃时可能在末尾留下写了一半的记录：Unpacker 遇到不完整的数据会直接结束，
+    而残缺字节恰好能解析出的非法记录会在此停止重放。其后的内容一律视为损坏。
+    """
+    valid_end = 0
+    try:
+        with open(DOCUMENTS_LOG, 'rb') as f:
+            unpacker = msgpack.Unpacker(f, raw=False, read_size=UNPACK_READ_SIZE)
+            try:
+                for record in unpacker:
+                    if not _is_meta_record(record):
+                        break
+                    _apply_meta_record(metas, record)
+                    valid_end = unpacker.tell()
+            except (ValueError, TypeError, KeyError):
+                pass
+    except FileNotFoundError:
+        pass
+    return valid_end
+
+def _is_meta_record(record) -> bool:
+    """检查日志记录的结构是否完整"""
+    return (
+        isinstance(record, dict)
+        and record.get("op") in ("put", "del")
+        and isinstance(record.get("meta"), dict)
+        and "id" in record["meta"]
+    )
+
+def _repair_meta_log_sync():
+    """截掉日志末尾残缺的记录，调用方需持有 _meta_lock 写锁
+
+    否则之后追加的记录会接在残缺字节之后，重放时全部丢失。
+    """
+    valid_end = _replay_meta_log_sync({})
     try:
-        with _file_lock:
-            with open(DOCUMENTS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        return [DocumentMeta(**meta) for meta in data]
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
-
-def _save_document_metas_sync(metas: List[DocumentMeta]):
-    """保存文档元数据到JSON文件"""
-    with _file_lock:
-        # 原子写入
-        fd, tmp_path = tempfile.mkstemp(dir=BASE_DIR, prefix="documents_", suffix=".json")
+        size = os.path.getsize(DOCUMENTS_LOG)
+    except OSError:
+        return
+    if size > valid_end:
+        logger.warning("Truncating %d corrupt byte(s) at the end of %s", size - valid_end, DOCUMENTS_LOG)
+        with open(DOCUMENTS_LOG, 'r+b') as f:
+            f.truncate(valid_end)
+            f.flush()
+            os.fsync(f.fileno())
+        _invalidate_meta_cache()
+
+def _read_legacy_metas_sync() -> Dict[str, Dict[str, Any]]:
+    """读取旧版 documents.json 中的元数据，不修改磁盘"""
+    try:
+        with open(LEGACY_DOCUMENTS_FILE, 'rb') as f:
+            return {meta["id"]: _meta_from_record(meta) for meta in orjson.loads(f.read())}
+    except (orjson.JSONDecodeError, FileNotFoundError):
+        return {}
+
+def _migrate_legacy_metas_sync():
+    """一次性迁移：将旧版 documents.json 转换为msgpack快照
+
+    迁移完成后旧文件移入备份目录。
+    """
+    if os.path.exists(DOCUMENTS_FILE) or not os.path.exists(LEGACY_DOCUMENTS_FILE):
+        return
+    
+    _save_document_metas_sync(list(_read_legacy_metas_sync().values()))
+    
+    _ensure_dirs_exist()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    name = os.path.basename(LEGACY_DOCUMENTS_FILE)
+    os.replace(LEGACY_DOCUMENTS_FILE, os.path.join(BACKUP_DIR, f"{name}.{timestamp}"))
+
+def _stat_key(path: str) -> Optional[Tuple[int, int]]:
+    """返回文件的 (st_mtime_ns, st_size)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _invalidate_meta_cache():
+    """使元数据缓存失效"""
+    global _meta_cache
+    _meta_cache = None
+
+def _load_meta_index_sync() -> Tuple[Tuple[Dict[str, Any], ...], Dict[str, int]]:
+    """加载文档元数据及 ID -> 下标 索引：快照 + 日志重放，文件未变化时直接返回缓存
+
+    返回的元组和字典在缓存中共享，调用方不可修改。
+    """
+    global _meta_cache
+    with _meta_lock.read():
+        key = (_stat_key(DOCUMENTS_FILE), _stat_key(DOCUMENTS_LOG))
+        if _meta_cache is not None and _meta_cache[0] == key:
+            return _meta_cache[1], _meta_cache[2]
+        metas = _read_meta_snapshot_sync()
+        _replay_meta_log_sync(metas)
+        result = tuple(metas.values())
+        index = {meta["id"]: i for i, meta in enumerate(result)}
+        _meta_cache = (key, result, index)
+        return result, index
+
+def _load_document_metas_sync() -> Tuple[Dict[str, Any], ...]:
+    """加载文档元数据
+
+    返回的元组在缓存中共享，需要修改时请先 list(...)。
+    """
+    return _load_meta_index_sync()[0]
+
+def _get_document_meta_sync(doc_id: str) -> Optional[Dict[str, Any]]:
+    """按ID查找单个文档的元数据，O(1)"""
+    metas, index = _load_meta_index_sync()
+    i = index.get(doc_id)
+    return None if i is None else metas[i]
+
+def _save_document_metas_sync(metas: Sequence[Dict[str, Any]]):
+    """将完整的元数据快照写入documents.msgpack，并清空日志"""
+    with _meta_lock.write():
+        data = msgpack.packb(list(metas), default=_encode_meta_value, use_bin_type=True)
+        _atomic_write_sync(DOCUMENTS_FILE, data, prefix="documents_", suffix=".msgpack")
+        # 快照已包含日志中的全部变更；即使在此之前崩溃，重放日志也是幂等的
+        with open(DOCUMENTS_LOG, 'wb'):
+            pass
+        _invalidate_meta_cache()
+
+def _compact_metas_if_needed_sync():
+    """日志超过快照两倍大小时进行压缩"""
+    try:
+        log_size = os.path.getsize(DOCUMENTS_LOG)
+    except OSError:
+        return
+    try:
+        snapshot_size = os.path.getsize(DOCUMENTS_FILE)
+    except OSError:
+        snapshot_size = 0
+    if log_size > max(2 * snapshot_size, COMPACT_MIN_BYTES):
+        _save_document_metas_sync(_load_document_metas_sync())
+
+def _pack_meta_record(op: str, meta: dict) -> bytes:
+    """将一条元数据变更记录（put/del）序列化为msgpack"""
+    return msgpack.packb({"op": op, "meta": meta}, default=_encode_meta_value, use_bin_type=True)
+
+def _append_meta_records_sync(records: List[bytes]):
+    """向日志追加一批已序列化的元数据变更记录，整批只fsync一次"""
+    # msgpack 自带长度信息，记录之间无需分隔符
+    data = b"".join(records)
+    global _meta_log_repaired
+    with _meta_lock.write():
+        # 上次进程崩溃可能留下残缺的记录，本进程第一次追加前先截掉
+        if not _meta_log_repaired:
+            _repair_meta_log_sync()
+            _meta_log_repaired = True
+        with open(DOCUMENTS_LOG, 'ab') as f:
+            start = os.fstat(f.fileno()).st_size
+            try:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                # 本次追加失败时回滚到追加前的长度，不留下残缺记录
+                f.truncate(start)
+                raise
+        _invalidate_meta_cache()
+        _compact_metas_if_needed_sync()
+
+def _init_id_counter_sync():
+    """初始化ID计数器：取 next_id.bin 中的值与现有最大数字ID+1 中较大者"""
+    global _next_id
+    with _id_lock:
+        if _next_id is not None:
+            return
+        stored = 1
         try:
-            with os.fdopen(fd, 'w', encoding='utf-8') as f:
-                json.dump([meta.model_dump() for meta in metas], f, default=str, indent=2)
-            os.replace(tmp_path, DOCUMENTS_FILE)
-        finally:
-            if os.path.exists(tmp_path):
-                try:
-                    os.remove(tmp_path)
-                except OSError:
-                    pass
+            with open(NEXT_ID_FILE, 'rb') as f:
+                stored = struct.unpack(">Q", f.read(8))[0]
+        except (FileNotFoundError, struct.error):
+            pass
+        numeric_ids = [int(meta["id"]) for meta in _load_document_metas_sync() if meta["id"].isdigit()]
+        _next_id = max([stored, *(i + 1 for i in numeric_ids)])
+
+def _allocate_document_id_sync() -> str:
+    """分配一个新的文档ID，并持久化计数器，O(1) 且并发安全"""
+    global _next_id
+    _init_id_counter_sync()
+    with _id_lock:
+        doc_id = _next_id
+        _next_id += 1
+        _atomic_write_sync(NEXT_ID_FILE, struct.pack(">Q", _next_id), prefix="next_id_", suffix=".bin")
+    return str(doc_id)
 
 def _read_file_content_sync(file_path: str) -> str:
     """读取文件内容"""
@@ -112,130 +473,338 @@ def _read_file_content_sync(file_path: str) -> str:
         return ""
 
 def _write_file_content_sync(file_path: str, content: str):
-    """写入文件内容"""
+    """写入文件内容
+
+    先写临时文件再 os.replace，旧inode保持不变，因此通过硬链接做的备份不会被覆盖。
+    """
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+    _atomic_write_sync(file_path, content.encode('utf-8'), prefix=".tmp_", suffix=".lix", mode=CONTENT_FILE_MODE)
+
+def _fadvise_sync(path: str, advice: str):
+    """向内核提示文件的访问模式（posix_fadvise），不支持的平台上为空操作"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _warm_metas_sync():
+    """启动时预读元数据快照和日志到页缓存"""
+    for path in (DOCUMENTS_FILE, DOCUMENTS_LOG):
+        _fadvise_sync(path, "POSIX_FADV_WILLNEED")
+
+def _copy_file_sync(source_path: str, dest_path: str):
+    """复制文件：优先用 os.copy_file_range 在内核中完成，不经过用户态；不支持时退回 shutil.copy2"""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            shutil.copystat(source_path, dest_path)
+            return
+        except OSError as e:
+            # 较老的内核或部分文件系统不支持跨文件系统的 copy_file_range
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    shutil.copy2(source_path, dest_path)
+
+# os.link 失败时退回复制的错误码：跨文件系统，或文件系统不支持硬链接（如FAT、部分网络文件系统）
+_LINK_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
 
 def _backup_file_sync(source_path: str, backup_path: str):
-    """备份文件"""
+    """备份文件：优先使用硬链接（不复制数据），跨文件系统或不支持硬链接时退回复制"""
     if os.path.exists(source_path):
         os.makedirs(os.path.dirname(backup_path), exist_ok=True)
-        shutil.copy2(source_path, backup_path)
+        try:
+            os.link(source_path, backup_path)
+        except OSError as e:
+            if e.errno not in _LINK_UNSUPPORTED_ERRNOS:
+                raise
+            _copy_file_sync(source_path, backup_path)
+        # 备份很少被读取，不让它占用页缓存，挤掉热点的元数据页
+        _fadvise_sync(backup_path, "POSIX_FADV_DONTNEED")
 
-async def load_documents() -> List[Document]:
-    """加载所有文档（包含内容）"""
-    def _load():
-        _ensure_dirs_exist()
-        metas = _load_document_metas_sync()
-        documents = []
-        
-        for meta in metas:
-            content = _read_file_content_sync(meta.file_path)
-            doc = Document(
-                id=meta.id,
-                title=meta.title,
-                content=content,
-                created_at=meta.created_at,
-                updated_at=meta.updated_at
-            )
-            documents.append(doc)
-        
-        return documents
-    
-    return await asyncio.to_thread(_load)
+def _should_backup(doc_id: str) -> bool:
+    """同一文档在 BACKUP_MIN_INTERVAL_NS 内只备份一次，调用方需持有该文档的内容锁"""
+    now = time.monotonic_ns()
+    last = _last_backup_ns.get(doc_id)
+    if last is not None and now - last < BACKUP_MIN_INTERVAL_NS:
+        return False
+    _last_backup_ns[doc_id] = now
+    return True
 
-async def get_document_by_id(doc_id: str) -> Optional[Document]:
-    """根据ID获取单个文档"""
-    def _get():
-        _ensure_dirs_exist()
-        metas = _load_document_metas_sync()
-        
-        for meta in metas:
-            if meta.id == doc_id:
-                content = _read_file_content_sync(meta.file_path)
-                return Document(
-                    id=meta.id,
-                    title=meta.title,
-                    content=content,
-                    created_at=meta.created_at,
-                    updated_at=meta.updated_at
-                )
-        return None
+def _flush_document_sync(doc_id: str, document: Optional[Document], is_new: bool) -> bytes:
+    """将单个文档的变更写入内容文件，返回待追加的元数据日志记录"""
+    file_path = _get_file_path(doc_id)
     
-    return await asyncio.to_thread(_get)
-
-async def save_document(document: Document, is_new: bool = False):
-    """保存文档（内容和元数据）"""
-    def _save():
-        _ensure_dirs_exist()
-        
-        # 准备文件路径
-        file_path = _get_file_path(document.id)
+    # 先序列化记录，失败时不会留下已改动的内容文件
+    if document is None:
+        record = _pack_meta_record("del", {"id": doc_id})
+    else:
+        record = _pack_meta_record("put", {
+            "id": document.id,
+            "title": document.title,
+            "file_path": file_path,
+            # 直接转为ISO字符串，不经过msgpack的default回调
+            "created_at": document.created_at.isoformat(),
+            "updated_at": document.updated_at.isoformat(),
+        })
+    
+    with _content_lock(doc_id).write():
+        if document is None:
+            # 备份并删除原文件
+            if os.path.exists(file_path):
+                backup_path = _get_backup_path(doc_id)
+                _backup_file_sync(file_path, backup_path)
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            return record
         
         # 如果是更新操作，先备份原文件
-        if not is_new and os.path.exists(file_path):
-            backup_path = _get_backup_path(document.id)
+        if not is_new and os.path.exists(file_path) and _should_backup(doc_id):
+            backup_path = _get_backup_path(doc_id)
             _backup_file_sync(file_path, backup_path)
         
         # 写入文件内容
         _write_file_content_sync(file_path, document.content)
+    return record
+
+def _flush_writes_sync(writes: Dict[str, Tuple[Optional[Document], bool]]) -> Dict[str, Exception]:
+    """将一批合并后的变更落盘：逐个写入文档内容，再一次性追加元数据日志
+
+    每个文档单独处理，某个文档失败不影响其他文档；返回失败文档的 ID -> 异常。
+    """
+    _ensure_dirs_exist()
+    records = []
+    errors: Dict[str, Exception] = {}
+    
+    for doc_id, (document, is_new) in writes.items():
+        try:
+            records.append(_flush_document_sync(doc_id, document, is_new))
+        except Exception as e:
+            errors[doc_id] = e
+    
+    if records:
+        try:
+            _append_meta_records_sync(records)
+        except Exception as e:
+            # 日志追加失败时，本批所有文档都未落盘
+            return {doc_id: errors.get(doc_id, e) for doc_id in writes}
+    return errors
+
+async def _writer_loop():
+    """后台写入任务：取出队列中积压的所有变更，同一文档只保留最后一次，合并为一次落盘
+
+    失败的文档在退避后连同新入队的变更一起重试（重写内容文件与重复追加日志记录都是幂等的），
+    超过 WRITE_MAX_ATTEMPTS 次后放弃：等待中的请求收到异常，内存中的变更被丢弃。
+    """
+    # 尚未落盘的变更：文档ID -> [文档, is_new, 等待结果的futures, 已失败次数]
+    writes: Dict[str, list] = {}
+    retry_delay = WRITE_RETRY_MIN_DELAY
+    
+    while True:
+        if not writes:
+            _merge_write(writes, await _write_queue.get())
+        while not _write_queue.empty():
+            _merge_write(writes, _write_queue.get_nowait())
         
-        # 更新元数据
-        metas = _load_document_metas_sync()
-        
-        # 创建或更新元数据
-        meta = DocumentMeta(
-            id=document.id,
-            title=document.title,
-            file_path=file_path,
-            created_at=document.created_at,
-            updated_at=document.updated_at
-        )
-        
-        # 查找现有元数据并更新，或添加新的
-        updated = False
-        for i, existing_meta in enumerate(metas):
-            if existing_meta.id == document.id:
-                metas[i] = meta
-                updated = True
-                break
+        try:
+            errors = await asyncio.to_thread(
+                _flush_writes_sync, {doc_id: (w[0], w[1]) for doc_id, w in writes.items()}
+            )
+        except Exception as e:
+            # 意料之外的失败（如无法创建目录）按整批失败处理，写入任务本身不能退出
+            errors = {doc_id: e for doc_id in writes}
         
-        if not updated:
-            metas.append(meta)
+        for doc_id in list(writes):
+            document, _, futures, failures = writes[doc_id]
+            error = errors.get(doc_id)
+            if error is not None:
+                if failures + 1 < WRITE_MAX_ATTEMPTS:
+                    writes[doc_id][3] = failures + 1
+                    logger.warning("Failed to write document %s, will retry", doc_id, exc_info=error)
+                    continue
+                logger.error(
+                    "Giving up on writing document %s after %d attempts", doc_id, WRITE_MAX_ATTEMPTS,
+                    exc_info=error,
+                )
+            
+            del writes[doc_id]
+            # 只移除这一版，期间新入队的变更保留在内存中
+            if doc_id in _pending_writes and _pending_writes[doc_id] is document:
+                del _pending_writes[doc_id]
+            for done in futures:
+                if not done.done():
+                    if error is None:
+                        done.set_result(None)
+                    else:
+                        done.set_exception(error)
+                _write_queue.task_done()
         
-        # 保存元数据
-        _save_document_metas_sync(metas)
+        if writes:
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, WRITE_RETRY_MAX_DELAY)
+        else:
+            retry_delay = WRITE_RETRY_MIN_DELAY
+
+def _merge_write(writes: Dict[str, list], item: tuple):
+    """将一个队列项合并进待写入的变更，同一文档只保留最后一次"""
+    doc_id, document, is_new, done = item
+    if doc_id in writes:
+        _, prev_is_new, futures, _ = writes[doc_id]
+        # 先创建后更新，仍按新文档处理（磁盘上没有旧文件可备份）；新版本重新计算失败次数
+        writes[doc_id] = [document, is_new or prev_is_new, futures + [done], 0]
+    else:
+        writes[doc_id] = [document, is_new, [done], 0]
+
+async def _enqueue_write(doc_id: str, document: Optional[Document], is_new: bool, durable: bool):
+    """提交一次变更；durable为True时等待其落盘后再返回，最终落盘失败时返回500"""
+    _pending_writes[doc_id] = document
+    done = asyncio.get_running_loop().create_future()
+    await _write_queue.put((doc_id, document, is_new, done))
+    if durable:
+        try:
+            await done
+        except Exception:
+            raise HTTPException(status_code=500, detail="Failed to write document")
+    else:
+        # 非持久模式下无人等待结果，避免 "exception was never retrieved" 警告
+        done.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+@app.on_event("startup")
+async def _start_writer():
+    global _write_queue, _writer_task
+    await asyncio.to_thread(_migrate_legacy_metas_sync)
+    await asyncio.to_thread(_init_id_counter_sync)
+    await asyncio.to_thread(_warm_metas_sync)
+    _write_queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_writer_loop())
+
+@app.on_event("shutdown")
+async def _stop_writer():
+    # 等待积压的变更全部落盘
+    await _write_queue.join()
+    _writer_task.cancel()
+
+def _read_meta_content_sync(meta: Dict[str, Any]) -> str:
+    """读取元数据对应的文档内容"""
+    with _content_lock(meta["id"]).read():
+        return _read_file_content_sync(meta["file_path"])
+
+def _read_document_sync(meta: Dict[str, Any]) -> Document:
+    """读取文档内容并与元数据组装为Document"""
+    return Document.model_construct(
+        id=meta["id"],
+        title=meta["title"],
+        content=_read_meta_content_sync(meta),
+        created_at=meta["created_at"],
+        updated_at=meta["updated_at"]
+    )
+
+def _document_json(meta: Dict[str, Any], content: Optional[str]) -> bytes:
+    """将文档序列化为单个JSON对象，content为None时只包含元数据"""
+    item = {"id": meta["id"], "title": meta["title"]}
+    if content is not None:
+        item["content"] = content
+    item["created_at"] = meta["created_at"]
+    item["updated_at"] = meta["updated_at"]
+    return orjson.dumps(item)
+
+def _read_document_json_sync(meta: Dict[str, Any]) -> bytes:
+    """读取文档内容并直接序列化为JSON，文件I/O与序列化在同一线程中完成"""
+    return _document_json(meta, _read_meta_content_sync(meta))
+
+def _pending_document_json(document: Document, include_content: bool) -> bytes:
+    """序列化尚未落盘的文档"""
+    item = document.model_dump()
+    return _document_json(item, item["content"] if include_content else None)
+
+async def iter_documents_json(include_content: bool = True) -> AsyncIterator[bytes]:
+    """逐个读取文档，以JSON数组的形式增量输出，尚未落盘的变更优先
+
+    每次只在内存中保留一个文档，峰值内存与文档总量无关。
+    """
+    pending = dict(_pending_writes)
+    _ensure_dirs_exist()
+    metas, index = await asyncio.to_thread(_load_meta_index_sync)
     
-    await asyncio.to_thread(_save)
+    yield b"["
+    sep = b""
+    for meta in metas:
+        if meta["id"] in pending:
+            document = pending[meta["id"]]
+            if document is None:
+                continue
+            chunk = _pending_document_json(document, include_content)
+        elif include_content:
+            chunk = await asyncio.to_thread(_read_document_json_sync, meta)
+        else:
+            chunk = _document_json(meta, None)
+        yield sep + chunk
+        sep = b","
+    
+    # 尚未落盘的新文档
+    for doc_id, document in pending.items():
+        if document is not None and doc_id not in index:
+            yield sep + _pending_document_json(document, include_content)
+            sep = b","
+    yield b"]"
 
-async def delete_document_by_id(doc_id: str) -> bool:
-    """删除文档"""
-    def _delete():
+async def get_document_by_id(doc_id: str) -> Optional[Document]:
+    """根据ID获取单个文档"""
+    if doc_id in _pending_writes:
+        return _pending_writes[doc_id]
+    
+    def _get():
         _ensure_dirs_exist()
-        metas = _load_document_metas_sync()
-        
-        # 查找并删除元数据
-        for i, meta in enumerate(metas):
-            if meta.id == doc_id:
-                # 备份文件
-                if os.path.exists(meta.file_path):
-                    backup_path = _get_backup_path(doc_id)
-                    _backup_file_sync(meta.file_path, backup_path)
-                    # 删除原文件
-                    try:
-                        os.remove(meta.file_path)
-                    except OSError:
-                        pass
-                
-                # 删除元数据
-                metas.pop(i)
-                _save_document_metas_sync(metas)
-                return True
-        
-        return False
+        meta = _get_document_meta_sync(doc_id)
+        if meta is None:
+            return None
+        return _read_document_sync(meta)
     
-    return await asyncio.to_thread(_delete)
+    return await asyncio.to_thread(_get)
+
+async def save_document(document: Document, is_new: bool = False, durable: bool = True):
+    """保存文档（内容和元数据），由后台写入任务合并落盘"""
+    await _enqueue_write(document.id, document, is_new, durable)
+
+async def delete_document_by_id(doc_id: str, durable: bool = True) -> bool:
+    """删除文档"""
+    # 先查尚未落盘的变更，再按ID查元数据索引，都是O(1)，不读取文档内容
+    if doc_id in _pending_writes:
+        if _pending_writes[doc_id] is None:
+            return False
+    elif await asyncio.to_thread(_get_document_meta_sync, doc_id) is None:
+        return False
+    await _enqueue_write(doc_id, None, False, durable)
+    return True
+
+def _ensure_utf8(*values: Optional[str]):
+    """拒绝无法编码为UTF-8的文本（422）
+
+    JSON 允许单独的代理字符（如 \\ud800），这类字符串无法写入磁盘，必须在提交给后台写入任务之前拒绝。
+    不使用pydantic校验器，因为其422响应会原样回显输入，而回显本身同样无法编码。
+    """
+    for value in values:
+        if value is None:
+            continue
+        try:
+            value.encode('utf-8')
+        except UnicodeEncodeError:
+            raise HTTPException(status_code=422, detail="Text must be valid UTF-8 (lone surrogates are not allowed)")
 
 # API路由
 @app.get("/")
@@ -243,24 +812,38 @@ async def root():
     return {"message": "Shareboard API is running"}
 
 @app.get("/api/documents", response_model=List[Document])
-async def get_documents():
-    """获取所有文档"""
-    return await load_documents()
+async def get_documents(include_content: bool = True):
+    """获取所有文档，流式输出；include_content=false 时只返回元数据"""
+    return StreamingResponse(iter_documents_json(include_content), media_type="application/json")
 
 @app.get("/api/documents/{document_id}", response_model=Document)
 async def get_document(document_id: str):
     """获取特定文档"""
-    document = await get_document_by_id(document_id)
-    if document is None:
+    if document_id in _pending_writes:
+        document = _pending_writes[document_id]
+        if document is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        return document
+    
+    # 查找元数据、读取文件和JSON序列化在一次线程切换中完成，不占用事件循环
+    def _get():
+        _ensure_dirs_exist()
+        meta = _get_document_meta_sync(document_id)
+        if meta is None:
+            return None
+        return _read_document_json_sync(meta)
+    
+    body = await asyncio.to_thread(_get)
+    if body is None:
         raise HTTPException(status_code=404, detail="Document not found")
-    return document
+    return Response(content=body, media_type="application/json")
 
 @app.post("/api/documents", response_model=Document)
-async def create_document(document: DocumentCreate):
+async def create_document(document: DocumentCreate, durable: bool = True):
     """创建新文档"""
+    _ensure_utf8(document.title, document.content)
     # 生成文档ID
-    existing_docs = await load_documents()
-    doc_id = str(len(existing_docs) + 1)
+    doc_id = await asyncio.to_thread(_allocate_document_id_sync)
     
     now = datetime.now()
     new_document = Document(
@@ -271,12 +854,13 @@ async def create_document(document: DocumentCreate):
         updated_at=now
     )
     
-    await save_document(new_document, is_new=True)
+    await save_document(new_document, is_new=True, durable=durable)
     return new_document
 
 @app.put("/api/documents/{document_id}", response_model=Document)
-async def update_document(document_id: str, document_update: DocumentUpdate):
+async def update_document(document_id: str, document_update: DocumentUpdate, durable: bool = True):
     """更新文档"""
+    _ensure_utf8(document_update.title, document_update.content)
     existing_doc = await get_document_by_id(document_id)
     if existing_doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -289,26 +873,72 @@ async def update_document(document_id: str, document_update: DocumentUpdate):
         updated_doc.content = document_update.content
     updated_doc.updated_at = datetime.now()
     
-    await save_document(updated_doc, is_new=False)
+    await save_document(updated_doc, is_new=False, durable=durable)
     return updated_doc
 
 @app.delete("/api/documents/{document_id}")
-async def delete_document(document_id: str):
+async def delete_document(document_id: str, durable: bool = True):
     """删除文档"""
-    success = await delete_document_by_id(document_id)
+    success = await delete_document_by_id(document_id, durable=durable)
     if not success:
         raise HTTPException(status_code=404, detail="Document not found")
     return {"message": "Document deleted successfully"}
 
+async def _run_litex(code: str) -> str:
+    """在线程中运行 Litex 代码（pylitex.run 是阻塞调用，避免阻塞事件循环）"""
+    result = await asyncio.to_thread(pylitex.run, code)
+    return result["message"]
+
+def _evict_failed_litex_run(key: bytes, task: asyncio.Task):
+    """运行失败或被取消的结果不缓存"""
+    # 调用 task.exception() 同时标记异常已被读取，避免无人等待时的警告
+    if task.cancelled() or task.exception() is not None:
+        if _litex_cache.get(key) is task:
+            del _litex_cache[key]
+
+async def _run_litex_cached(code: str) -> str:
+    """运行 Litex 代码，相同代码的结果会被缓存（LRU）
+
+    编辑器自动运行时经常重复提交相同代码；正在运行中的相同代码也只执行一次，
+    其余请求等待同一个任务。每个请求通过 asyncio.shield 等待，
+    某个请求被取消（如客户端断开）不会影响共享的运行任务和其他请求。
+    """
+    key = hashlib.blake2b(code.encode('utf-8'), digest_size=16).digest()
+    # 缓存的读写之间没有 await，在事件循环中天然是原子的，无需加锁
+    task = _litex_cache.get(key)
+    if task is not None:
+        _litex_cache.move_to_end(key)
+    else:
+        task = asyncio.create_task(_run_litex(code))
+        task.add_done_callback(functools.partial(_evict_failed_litex_run, key))
+        _litex_cache[key] = task
+        if len(_litex_cache) > LITEX_CACHE_SIZE:
+            _litex_cache.popitem(last=False)
+    return await asyncio.shield(task)
+
 @app.post("/api/run-litex", response_model=LitexCodeResponse)
 async def run_litex_code(request: LitexCodeRequest):
     """运行 Litex 代码"""
     try:
-        result = pylitex.run(request.code)
-        return LitexCodeResponse(result=result["message"])
+        return LitexCodeResponse(result=await _run_litex_cached(request.code))
     except Exception as error:
         return LitexCodeResponse(result=f"Error: {str(error)}")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8004)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Shareboard API server")
+    parser.add_argument("--dump-metas", action="store_true",
+                        help="以缩进JSON格式打印当前的文档元数据（磁盘上为紧凑的msgpack格式）后退出，只读")
+    args = parser.parse_args()
+    
+    if args.dump_metas:
+        # 只读：尚未迁移时直接读取旧版 documents.json，不做迁移，也不修改磁盘上的任何文件
+        if not os.path.exists(DOCUMENTS_FILE) and os.path.exists(LEGACY_DOCUMENTS_FILE):
+            metas = list(_read_legacy_metas_sync().values())
+        else:
+            metas = list(_load_document_metas_sync())
+        print(orjson.dumps(metas, option=orjson.OPT_INDENT_2).decode('utf-8'))
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8004)